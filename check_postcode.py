@@ -1,65 +1,215 @@
 # Standard library imports
+import argparse
+import functools
+import gzip
+import hashlib
+import json
 import os
 import re
 import sys
-import tempfile
+import threading
 import time
 import warnings
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import random
 
 # Third-party imports
 import boto3
-from bs4 import BeautifulSoup
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from dateutil.relativedelta import relativedelta
-from markitdown import MarkItDown
+import lxml.etree
+import lxml.html
 import requests
+from requests.adapters import HTTPAdapter
+
+# Bedrock models selected with --model: the model ID, the region it is used in,
+# its on-demand price in USD per 1K input and output tokens, and whether it has
+# a latency-optimized inference tier in that region (only a few models and
+# regions do)
+MODELS = {
+    "claude-3.5-sonnet": {
+        "model_id": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "region": "us-west-2",
+        "input_price": 0.003,
+        "output_price": 0.015,
+        "latency_optimized": False,
+    },
+    "nova-pro": {
+        "model_id": "amazon.nova-pro-v1:0",
+        "region": "us-east-1",
+        "input_price": 0.0008,
+        "output_price": 0.0032,
+        "latency_optimized": False,
+    },
+    # Latency-optimized inference is served in us-east-2 through the US
+    # cross-region inference profile, and priced at the optimized rate
+    "claude-3.5-haiku": {
+        "model_id": "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+        "region": "us-east-2",
+        "input_price": 0.001,
+        "output_price": 0.005,
+        "latency_optimized": True,
+    },
+}
+DEFAULT_MODEL = "claude-3.5-sonnet"
+AWS_PROFILE = "us-west-2-profile"
 
-MODEL_ID = "anthropic.claude-3-5-sonnet-20241022-v2:0"
-AWS_REGION = "us-west-2"
+# Whether Bedrock accepted latency-optimized inference for a model ID, learnt
+# from the first request made with it
+LATENCY_OPTIMIZED_SUPPORT = {}
 
-#MODEL_ID = "amazon.nova-pro-v1:0"
-#AWS_REGION = "us-east-1"
-AWS_PROFILE = "us-west-2-profile"
+# Several postcodes are summarised with one Bedrock batch inference job when
+# both of these are set, otherwise each postcode is summarised on demand
+BATCH_S3_URI = os.environ.get("BATCH_S3_URI")  # e.g. s3://my-bucket/uk_postcode_report
+BATCH_ROLE_ARN = os.environ.get("BATCH_ROLE_ARN")
+BATCH_POLL_SECONDS = 60
+
+# Bedrock fails batch jobs with fewer records than this during validation, so
+# smaller runs are always summarised on demand
+BATCH_MIN_RECORDS = 100
+
+# Jobs unfinished after this long are stopped and summarised on demand instead
+BATCH_TIMEOUT_HOURS = 24
+
+# Batch inference is billed at half the on-demand token price
+BATCH_PRICE_FACTOR = 0.5
+
+# Default number of trailing months of crime data to include (0 leaves crime
+# out), overridden with --months
+CRIME_MONTHS = 3
+
+# Extracted StreetCheck page text and summaries are cached here; crime pages for
+# past months never change, the others (including the newest crime month, which
+# may not be fully published yet) are refetched once they are older than
+# CACHE_TTL_SECONDS. Summaries are keyed by model and prompt, so never expire.
+# Bump CACHE_VERSION when the text extraction changes to ignore older entries
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "uk_postcode_report")
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+CACHE_VERSION = 2
+
+# Average seconds between StreetCheck requests (0 disables rate limiting), and
+# how many requests may be made back to back before the limit applies
+STREETCHECK_MIN_DELAY = float(os.environ.get("STREETCHECK_MIN_DELAY", "0.3"))
+STREETCHECK_BURST = 3
+
+# How many postcodes are fetched and summarised at the same time; each one
+# fetches its StreetCheck pages on its own five threads
+POSTCODE_CONCURRENCY = 3
+
+# Inline script and style blocks, cut out before parsing
+SCRIPT_STYLE_RE = re.compile(rb'<(script|style)\b[^>]*>.*?</\1\s*>', re.DOTALL | re.IGNORECASE)
+
+# Runs of whitespace, collapsed to a single space in the extracted text and
+# removed from postcodes
+WHITESPACE_RE = re.compile(r'\s+')
+
+# The final report, which the model wraps in <summary> tags
+SUMMARY_RE = re.compile(r'<summary>(.*?)</summary>', re.DOTALL)
 
 # Suppress the specific datetime warning from botocore
 warnings.filterwarnings('ignore', category=DeprecationWarning,
                        message='datetime.datetime.utcnow.*')
 
+# Common user agents to rotate between
+USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0"
+)
+
+# Headers to simulate a real browser (User-Agent is chosen per request).
+# Accept-Encoding is left to requests, which only offers br and zstd when the
+# brotli and zstandard packages are installed to decode them
+BASE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "DNT": "1",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-User": "?1"
+}
+
+# Shared across fetch threads so connections to StreetCheck are reused
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+SESSION.headers.update(BASE_HEADERS)
+
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket shared by all fetch threads, allowing up to
+    `burst` requests at once and `rate` requests per second on average.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Take a token now, going into debt if the bucket is empty, and
+            # sleep outside the lock until that token would have been available
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+STREETCHECK_LIMITER = (RateLimiter(1 / STREETCHECK_MIN_DELAY, STREETCHECK_BURST)
+                       if STREETCHECK_MIN_DELAY > 0 else None)
 
 
-def html_to_plain_text(html_string):
+def html_to_plain_text(html_bytes):
     """
-    Convert HTML string to plain text, removing links and image references.
+    Convert UTF-8 encoded HTML to plain text, removing links and image references.
+    Navigation, footers and sidebars are dropped, and only the page's main
+    content is kept when it can be found, to keep the prompt small.
 
     Args:
-        html_string (str): String containing HTML content
+        html_bytes (bytes): UTF-8 encoded HTML content
 
     Returns:
         str: Plain text with HTML tags and media references removed
     """
-    # Create BeautifulSoup object with 'html.parser'
-    soup = BeautifulSoup(html_string, 'html.parser')
+    # Drop script and style blocks up front so lxml never builds nodes for them
+    html_bytes = SCRIPT_STYLE_RE.sub(b'', html_bytes)
 
-    # Remove all script and style elements
-    for script in soup(["script", "style"]):
-        script.decompose()
+    # Parse the bytes with lxml directly, with the encoding given up front so no
+    # charset detection is needed; the tree work below runs in libxml2
+    try:
+        doc = lxml.html.fromstring(html_bytes, parser=lxml.html.HTMLParser(encoding='utf-8'))
+    except lxml.etree.ParserError:
+        # Empty bodies, including pages that were nothing but script blocks
+        return ""
+
+    # Remove all images, page boilerplate and any remaining script and style
+    # elements, keeping trailing text
+    lxml.etree.strip_elements(doc, 'script', 'style', 'img', 'nav', 'footer', 'aside',
+                              with_tail=False)
 
-    # Remove all images
-    for img in soup.find_all('img'):
-        img.decompose()
+    # Keep just the main content container if the page has one
+    content = doc.find('.//main')
+    if content is None:
+        content = doc.get_element_by_id('content', doc)
 
     # Replace links with their text content
-    for a in soup.find_all('a'):
-        a.replace_with(a.text)
+    lxml.etree.strip_tags(doc, 'a')
 
     # Get text and normalize whitespace
-    text = soup.get_text()
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = ' '.join(chunk for chunk in chunks if chunk)
-
-    return text.strip()
+    text = content.text_content()
+    return WHITESPACE_RE.sub(' ', text).strip()
 
 
 def cleanup_temp_file(filename):
@@ -71,17 +221,63 @@ def cleanup_temp_file(filename):
         if os.path.exists(filename):
             print(f"Warning: Temporary file {filename} still exists")
 
-def get_streetcheck_data(postcode, data_type="postcode", data_date=None):
+def clean_postcode(postcode):
+    # Remove all whitespace in a single pass and normalise the case
+    return WHITESPACE_RE.sub('', postcode).lower()
+
+
+def get_cache_path(*key_parts, suffix=".txt.gz"):
+    key_parts = (CACHE_VERSION,) + key_parts
+    key = hashlib.sha1(":".join(str(part) for part in key_parts).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}{suffix}")
+
+
+def read_cache(cache_path, ttl):
+    """
+    Read a cache entry
+    Args:
+        cache_path: Path returned by get_cache_path
+        ttl: Maximum age in seconds, or None if the entry never expires
+    Returns:
+        bytes: Cached content, or None if it isn't cached or has expired
+    """
+    try:
+        if ttl is not None and time.time() - os.path.getmtime(cache_path) > ttl:
+            return None
+        with gzip.open(cache_path, 'rb') as f:
+            return f.read()
+    except (OSError, EOFError):
+        return None
+
+
+def write_cache(cache_path, data):
+    # Write to a temporary file first so concurrent readers never see a partial
+    # entry; the name is unique per thread as fetch and summary threads may
+    # write the same entry at once
+    temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with gzip.open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: Could not write cache file {cache_path}: {e}")
+        if os.path.exists(temp_path):
+            cleanup_temp_file(temp_path)
+
+def get_streetcheck_data(postcode, data_type="postcode", data_date=None, session=SESSION):
     """
     Get data from StreetCheck for a given postcode
     Args:
         postcode: UK postcode
         data_type: Either "postcode" or "houseprices" for different page types
+        data_date: Optional "YYYY/MM" suffix, used for crime data
+        session: requests.Session to fetch with, so connections are pooled
     Returns:
-        str: HTML content of the page
+        str: Plain text content of the page
     """
-    # Clean the postcode - remove spaces and convert to uppercase
-    postcode = postcode.strip().replace(" ", "").lower()
+    # Clean the postcode - remove whitespace and convert to lowercase
+    postcode = clean_postcode(postcode)
 
     # Base URL with path based on data type
     base_url = "https://www.streetcheck.co.uk/"
@@ -94,34 +290,28 @@ def get_streetcheck_data(postcode, data_type="postcode", data_date=None):
     else:
         raise ValueError("data_type must be either 'postcode', 'houseprices', or 'crime'")
 
-    # Common user agents to rotate between
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0"
-    ]
-
-    # Headers to simulate a real browser
-    headers = {
-        "User-Agent": random.choice(user_agents),
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
-        "DNT": "1",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-        "Sec-Fetch-Dest": "document",
-        "Sec-Fetch-Mode": "navigate",
-        "Sec-Fetch-Site": "none",
-        "Sec-Fetch-User": "?1"
-    }
+    # Use the cached text of the page if there is a fresh copy, which skips
+    # both the request and the HTML conversion
+    # Crime figures are final for every month but the newest one published. The
+    # flag is part of the key, so a page cached while its month was the newest
+    # is fetched again once the month is final instead of being kept forever
+    final = data_type == "crime" and data_date != get_crime_months(1)[0]
+    cache_path = get_cache_path(data_type, postcode, data_date, final)
+    text = read_cache(cache_path, None if final else CACHE_TTL_SECONDS)
+    if text is not None:
+        print(f"Loaded cached {data_type} data for postcode {postcode}" + (f"/{data_date}" if data_date else ""))
+        return text.decode('utf-8')
+
+    # Only the User-Agent varies per request, the rest are set on SESSION
+    headers = {"User-Agent": random.choice(USER_AGENTS)}
 
     try:
-        # Add a small random delay to simulate human behavior
-        time.sleep(random.uniform(1, 3))
+        # Keep to the request rate limit to be polite to StreetCheck
+        if STREETCHECK_LIMITER:
+            STREETCHECK_LIMITER.wait()
 
         # Make the request
-        response = requests.get(
+        response = session.get(
             base_url + postcode + (f"/{data_date}" if data_date else ""),
             headers=headers,
             timeout=10,
@@ -132,8 +322,12 @@ def get_streetcheck_data(postcode, data_type="postcode", data_date=None):
         response.raise_for_status()
         print(f"Fetched {data_type} data for postcode {postcode}" + (f"/{data_date}" if data_date else ""))
 
-        # Return the HTML content
-        return html_to_plain_text(response.text)
+        # Convert, cache and return the page text; a page with no text is
+        # refetched next time rather than cached
+        text = html_to_plain_text(response.content)
+        if text:
+            write_cache(cache_path, text.encode('utf-8'))
+        return text
 
     except requests.RequestException as e:
         print(f"Error fetching {data_type} data for postcode {postcode}: {str(e)}")
@@ -142,53 +336,37 @@ def get_streetcheck_data(postcode, data_type="postcode", data_date=None):
 
 
 
-def initialize_bedrock_client(aws_profile: str) -> boto3.client:
-    session = boto3.Session(profile_name=aws_profile)
-    return session.client('bedrock-runtime', AWS_REGION)
-
-
-def get_content_summary(bedrock_runtime: boto3.client, text_content: str) -> str:
-    prompt = '''
-You are a data analyst specializing in demographic and housing statistics. Your task is to create a concise, factual summary of a given area based on the provided information.
-
-Here is the area description you need to analyze:
-
-<area_description>
-{text}
-</area_description>
+# Static instructions, sent as the system prompt so they form a reusable prefix
+SYSTEM_PROMPT = '''
+You are a data analyst specializing in demographic and housing statistics. Your task is to create a concise, factual summary of the area described inside <area_description> tags in the user's message. Maintain a professional and objective tone and focus on presenting the facts clearly and concisely.
 
 Instructions:
 
-1. Read through the area description carefully.
-
-2. Wrap your analysis inside <data_extraction> tags. Break down the information into the following categories:
+1. Wrap your analysis inside <data_extraction> tags. Break down the information into the following categories:
     - General characteristics of the area
     - Available amenities, including broadband speed
     - Demographics
     - Housing types and tenure
     - Economic activity
     - Household deprivation
-    - Crime statistics
 
     For each category:
     - List specific data points, including exact numbers and percentages where available.
-    - Calculate percentages explicitly (e.g., "Social rented housing: 150 out of 1000 total = 15%").
-    - Sum up totals where applicable (e.g., total crimes across all three months).
+    - Calculate percentages explicitly (e.g., "Social rented housing: 150 out of 1000 total = 15%") and check they add up within the category.
+    - Sum up totals where applicable.
     - Note any missing or unclear information.
 
-3. Pay special attention to:
+2. Pay special attention to:
     - The percentage of social rented housing
     - The percentage of households with deprivation across all dimensions
     - The level of unemployment
-    - The total count of crimes reported by category (sum across all three months)
 
-4. Based on your analysis, create a summary report using the following structure:
+3. Based on your analysis, create a summary report using the following structure and present it in <summary> tags:
 
 ```markdown
 ### Summary of [Area Name]
 
 #### Notable Statistics
-- **Quarter Total Crime/Population:** [percentage] ([total crimes]/[population])
 - **Social Rented Housing:** [percentage] ([count]/[total])
 - **Largest Ethnic Group:** [group name] ([percentage])
 - **Households with Deprivation in One or More Dimensions:** [percentage] ([count]/[total])
@@ -223,19 +401,111 @@ Instructions:
 
 - **Household Deprivation:**
     [List deprivation levels with percentages and counts]
+```
+'''
+
+# Appended to the system prompt when crime data is included
+CRIME_INSTRUCTIONS = '''
+The area description also includes crime data for the last {months} month(s). Add crime statistics as a category of your analysis, summing the count of crimes by category across all {months} month(s), and extend the report as follows:
 
-#### Crime Statistics (Quarter Total: [sum of all three months])
+- Start the Notable Statistics section with:
+```markdown
+- **Period Total Crime/Population:** [percentage] ([total crimes across all {months} month(s)]/[population])
+```
+
+- End the report with:
+```markdown
+#### Crime Statistics (Period Total: [sum of all {months} month(s)])
 [List crime statistics for each month, including total crimes and breakdown by category]
 ```
+'''
+
+PROMPT_TEMPLATE = '''
+<area_description>
+{text}
+</area_description>
+'''
+
+INFERENCE_CONFIG = {
+    "temperature": 0.0,
+    "maxTokens": 2048,
+    "topP": 1,
+}
+
+
+def build_prompt(text_content: str) -> str:
+    return PROMPT_TEMPLATE.format(text=text_content)
+
+
+def build_system_text(months: int) -> str:
+    if months:
+        return SYSTEM_PROMPT + CRIME_INSTRUCTIONS.format(months=months)
+    return SYSTEM_PROMPT
 
-5. Ensure that all percentages are accurate and add up correctly within their categories.
 
-6. In the Notable Statistics section, make sure to sum up the total crimes across all three months for the Quarter Total Crime/Population statistic.
+def build_system_prompt(months: int) -> list:
+    # No cachePoint is added: at well under 1K tokens the system prompt is below
+    # the minimum Bedrock caches as a prefix, so a checkpoint would do nothing
+    return [{"text": build_system_text(months)}]
 
-7. Present your final report in <summary> tags.
 
-Remember to maintain a professional and objective tone throughout the report. Focus on presenting the facts clearly and concisely.
-    '''.format(text=text_content)
+# Adaptive retries back off client-side on throttling, and the kept-alive
+# connection pool is shared by all calls made through the client
+BEDROCK_CONFIG = Config(
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True,
+    max_pool_connections=16,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_aws_session(aws_profile: str) -> boto3.Session:
+    return boto3.Session(profile_name=aws_profile)
+
+
+@functools.lru_cache(maxsize=None)
+def initialize_bedrock_client(aws_profile: str, region: str) -> boto3.client:
+    return get_aws_session(aws_profile).client('bedrock-runtime', region, config=BEDROCK_CONFIG)
+
+
+def converse_stream_latency_optimized(bedrock_runtime: boto3.client, model: dict, **kwargs) -> dict:
+    """
+    Call converse_stream with latency-optimized inference for models that have
+    it, falling back to standard inference if Bedrock rejects the setting.
+    Whether the setting is accepted is only worked out once per model, so
+    later invalid requests are never sent twice.
+    """
+    model_id = model["model_id"]
+    if not model["latency_optimized"] or not LATENCY_OPTIMIZED_SUPPORT.get(model_id, True):
+        return bedrock_runtime.converse_stream(**kwargs)
+    try:
+        response = bedrock_runtime.converse_stream(performanceConfig={"latency": "optimized"}, **kwargs)
+    except ClientError as err:
+        # Once the setting is known to work, a rejection is about the request itself
+        if err.response['Error']['Code'] != 'ValidationException' or model_id in LATENCY_OPTIMIZED_SUPPORT:
+            raise
+        # Only give up on the setting if the same request goes through without it
+        response = bedrock_runtime.converse_stream(**kwargs)
+        LATENCY_OPTIMIZED_SUPPORT[model_id] = False
+        return response
+    LATENCY_OPTIMIZED_SUPPORT[model_id] = True
+    return response
+
+
+def get_content_summary(bedrock_runtime: boto3.client, model: dict, months: int,
+                        text_content: str, echo: bool = False) -> tuple:
+    """
+    Summarise the area text with the Bedrock model
+    Args:
+        bedrock_runtime: Bedrock runtime client for the model's region
+        model: MODELS entry to summarise with
+        months: Number of months of crime data in the area text
+        text_content: Area text to summarise
+        echo: Print the response to stdout as it streams in
+    Returns:
+        tuple: Summary text and Bedrock usage dict, or (None, None) on error
+    """
+    prompt = build_prompt(text_content)
 
     messages = [
         {
@@ -248,102 +518,294 @@ Remember to maintain a professional and objective tone throughout the report. Fo
         }
     ]
 
-    inference_config = {
-        "temperature": 0.0,
-        "maxTokens": 2048,
-        "topP": 1,
-    }
-
     try:
-        response = bedrock_runtime.converse(
-            modelId=MODEL_ID,
+        response = converse_stream_latency_optimized(
+            bedrock_runtime,
+            model,
+            modelId=model["model_id"],
+            system=build_system_prompt(months),
             messages=messages,
-            inferenceConfig=inference_config
+            inferenceConfig=INFERENCE_CONFIG
         )
-        return response['output']['message']['content'][0]['text']
-    except Exception as err:
+
+        # Collect the text deltas as they arrive and join them once at the end;
+        # the closing metadata event carries the billed token counts
+        chunks = []
+        usage = {}
+        stop_reason = None
+        for event in response['stream']:
+            if 'contentBlockDelta' in event:
+                chunk = event['contentBlockDelta']['delta'].get('text', '')
+                chunks.append(chunk)
+                if echo:
+                    sys.stdout.write(chunk)
+                    sys.stdout.flush()
+            elif 'messageStop' in event:
+                stop_reason = event['messageStop']['stopReason']
+            elif 'metadata' in event:
+                usage = event['metadata']['usage']
+        summary = ''.join(chunks)
+        cache_summary(model, months, text_content, summary, stop_reason)
+        return summary, usage
+    except ClientError as err:
         print(f"Error getting summary: {err.response['Error']['Message']}")
+        return None, None
+    except BotoCoreError as err:
+        # Connection failures and timeouts have no service error response
+        print(f"Error getting summary: {err}")
+        return None, None
+
+
+def build_batch_model_input(model: dict, months: int, prompt: str) -> dict:
+    """
+    Build the model-native request body for one batch inference record
+    """
+    # Cross-region inference profile IDs put a geography prefix before the provider
+    if "anthropic." in model["model_id"]:
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": INFERENCE_CONFIG["maxTokens"],
+            "temperature": INFERENCE_CONFIG["temperature"],
+            "top_p": INFERENCE_CONFIG["topP"],
+            "system": build_system_text(months),
+            "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+        }
+    return {
+        "system": [{"text": build_system_text(months)}],
+        "messages": [{"role": "user", "content": [{"text": prompt}]}],
+        "inferenceConfig": {
+            "max_new_tokens": INFERENCE_CONFIG["maxTokens"],
+            "temperature": INFERENCE_CONFIG["temperature"],
+            "top_p": INFERENCE_CONFIG["topP"],
+        },
+    }
+
+
+def parse_batch_model_output(model_output: dict) -> tuple:
+    """
+    Extract the response text, token usage and stop reason from one batch
+    inference output record
+    """
+    if "content" in model_output:
+        content = model_output["content"]
+        usage = {
+            "inputTokens": model_output["usage"]["input_tokens"],
+            "outputTokens": model_output["usage"]["output_tokens"],
+        }
+        stop_reason = model_output.get("stop_reason")
+    else:
+        content = model_output["output"]["message"]["content"]
+        usage = model_output["usage"]
+        stop_reason = model_output.get("stopReason")
+    return ''.join(block.get("text", "") for block in content), usage, stop_reason
+
+
+def get_batch_summaries(aws_profile: str, model: dict, months: int, texts: dict) -> dict:
+    """
+    Summarise several postcodes with a single Bedrock batch inference job
+    Args:
+        aws_profile: AWS profile to use
+        model: MODELS entry to summarise with
+        months: Number of months of crime data in the area texts
+        texts: Area text keyed by postcode
+    Returns:
+        dict: (summary text, usage) keyed by postcode, leaving out any record
+            that failed, or None if the job didn't complete
+    """
+    session = get_aws_session(aws_profile)
+    s3 = session.client('s3', model["region"])
+    bedrock = session.client('bedrock', model["region"], config=BEDROCK_CONFIG)
+
+    job_name = f"uk-postcode-report-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    bucket, _, prefix = BATCH_S3_URI.removeprefix("s3://").partition("/")
+    prefix = f"{prefix.strip('/')}/{job_name}" if prefix.strip('/') else job_name
+    input_key = f"{prefix}/input.jsonl"
+
+    # One JSONL record per postcode, the postcode doubling as the record ID
+    records = [
+        json.dumps({"recordId": postcode, "modelInput": build_batch_model_input(model, months, build_prompt(text))})
+        for postcode, text in texts.items()
+    ]
+
+    try:
+        s3.put_object(Bucket=bucket, Key=input_key, Body="\n".join(records).encode('utf-8'))
+        job_arn = bedrock.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=BATCH_ROLE_ARN,
+            modelId=model["model_id"],
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{bucket}/{input_key}"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{bucket}/{prefix}/output/"}},
+            timeoutDurationInHours=BATCH_TIMEOUT_HOURS
+        )['jobArn']
+    except ClientError as err:
+        print(f"Error submitting batch job: {err.response['Error']['Message']}")
+        return None
+    except BotoCoreError as err:
+        print(f"Error submitting batch job: {err}")
+        return None
+    print(f"Submitted batch job {job_name} for {len(records)} postcodes")
+
+    try:
+        # Batch jobs are queued server-side, so poll until this one finishes
+        deadline = time.monotonic() + BATCH_TIMEOUT_HOURS * 60 * 60
+        while True:
+            status = bedrock.get_model_invocation_job(jobIdentifier=job_arn)['status']
+            if status not in ("Submitted", "Validating", "Scheduled", "InProgress", "Stopping"):
+                break
+            if time.monotonic() > deadline:
+                print(f"Batch job {job_name} did not finish within {BATCH_TIMEOUT_HOURS} hours, stopping it")
+                bedrock.stop_model_invocation_job(jobIdentifier=job_arn)
+                return None
+            time.sleep(BATCH_POLL_SECONDS)
+
+        if status not in ("Completed", "PartiallyCompleted"):
+            print(f"Batch job {job_name} finished with status {status}")
+            return None
+
+        # Results are written under <output uri>/<job id>/<input file name>.out
+        job_id = job_arn.split("/")[-1]
+        output = s3.get_object(Bucket=bucket, Key=f"{prefix}/output/{job_id}/input.jsonl.out")
+        lines = output['Body'].read().decode('utf-8').splitlines()
+    except ClientError as err:
+        print(f"Error getting batch job results: {err.response['Error']['Message']}")
         return None
+    except BotoCoreError as err:
+        print(f"Error getting batch job results: {err}")
+        return None
+
+    summaries = {}
+    for line in lines:
+        record = json.loads(line)
+        if "modelOutput" in record:
+            summary, usage, stop_reason = parse_batch_model_output(record["modelOutput"])
+            cache_summary(model, months, texts[record["recordId"]], summary, stop_reason)
+            # Flag the usage so it is priced at the batch rate
+            summaries[record["recordId"]] = summary, dict(usage, batch=True)
+        else:
+            print(f"Error getting summary for {record['recordId']}: {record.get('error')}")
 
+    return summaries
 
-# get trailing 3 months of crime data
-def get_three_months_data(postcode):
-    results = ""
+
+# get the trailing months for which crime data is published
+def get_crime_months(months=3):
     current_date = datetime.now()
-    four_months_ago = current_date - relativedelta(months=4)
+    first_month = current_date - relativedelta(months=months + 1)
 
-    # Iterate through the last 3 months (2 months ago, 1 month ago, and current month)
-    for i in range(3):
-        # Calculate the date for this iteration
-        target_date = four_months_ago + relativedelta(months=i)
-        formatted_date = target_date.strftime('%Y/%m')
+    # The last `months` months, up to and including 2 months ago
+    return [(first_month + relativedelta(months=i)).strftime('%Y/%m')
+            for i in range(months)]
 
-        # Get data for this month
-        postcode_html = get_streetcheck_data(postcode, "crime", formatted_date)
 
-        if postcode_html:
-            results += f"Data for {formatted_date}:\n"
-            results += postcode_html + "\n\n"  # Add double newline for separation
+def fetch_streetcheck_pages(postcode, crime_months, session=SESSION):
+    """
+    Fetch the postcode, house price and crime pages for a postcode concurrently
+    Args:
+        postcode: UK postcode
+        crime_months: List of "YYYY/MM" dates to fetch crime data for
+        session: requests.Session shared by all the fetches
+    Returns:
+        dict: Page text (or None on failure) keyed by (data_type, data_date)
+    """
+    tasks = [("postcode", None), ("houseprices", None)]
+    tasks += [("crime", month) for month in crime_months]
 
-    return results
+    # map returns the pages in task order, so no bookkeeping of futures is needed
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        htmls = executor.map(
+            lambda task: get_streetcheck_data(postcode, *task, session=session), tasks)
+        return dict(zip(tasks, htmls))
 
 
-def main():
-    # Set default postcode for Knightsbridge/Kensington area
-    default_postcode = "SW72BU"  # One of London's most expensive areas
+# format the trailing months of crime data
+def format_crime_data(crime_pages):
+    parts = []
 
-    # Get postcode from command line or use default
-    if len(sys.argv) > 1:
-        postcode = sys.argv[1].strip().replace(" ", "").lower()
-        if not postcode:  # If postcode is empty after cleaning
-            postcode = default_postcode
-    else:
-        postcode = default_postcode
+    # Iterate through the months in order
+    for formatted_date, postcode_html in crime_pages.items():
+        if postcode_html:
+            parts.append(f"Data for {formatted_date}:\n")
+            parts.append(postcode_html + "\n\n")  # Add double newline for separation
 
-    # Create filename
-    output_filename = f"postcode_summary_{postcode}.md"
+    return ''.join(parts)
 
-    # Exit if file already exists
-    if os.path.exists(output_filename):
-        print(f"Error: {output_filename} already exists.")
-        sys.exit(1)
 
-    # Get both types of HTML content
-    postcode_html = get_streetcheck_data(postcode, "postcode")
-    prices_html = get_streetcheck_data(postcode, "houseprices")
-    results = ""
+def get_area_text(postcode, months=CRIME_MONTHS, session=SESSION):
+    """
+    Fetch and combine all StreetCheck data for a postcode
+    Args:
+        postcode: Cleaned UK postcode
+        months: Number of trailing months of crime data to fetch
+        session: requests.Session to fetch the pages with
+    Returns:
+        str: Plain text of the postcode, house price and crime pages
+    """
+    # Fetch all pages concurrently
+    crime_months = get_crime_months(months)
+    pages = fetch_streetcheck_pages(postcode, crime_months, session)
+    postcode_html = pages[("postcode", None)]
+    prices_html = pages[("houseprices", None)]
+    parts = []
 
     # Process postcode data if available
     if postcode_html:
-        results += postcode_html + "\n\n"  # Add double newline for separation
+        parts.append(postcode_html + "\n\n")  # Add double newline for separation
     if prices_html:
-        results += prices_html
+        parts.append(prices_html)
 
     # get the crime data
-    crime_text = get_three_months_data(postcode)
-    results += crime_text
+    crime_text = format_crime_data(
+        {month: pages[("crime", month)] for month in crime_months})
+    parts.append(crime_text)
 
-    # Initialize Bedrock client
-    bedrock_runtime = initialize_bedrock_client(AWS_PROFILE)
+    return ''.join(parts)
 
-    # Get summary
-    summary = get_content_summary(bedrock_runtime, results)
 
-    # Calculate token estimates and costs
-    input_tokens = len(results) // 4
-    output_tokens = len(summary) // 4
-    input_price = input_tokens // 1000 * 0.0008
-    output_price = output_tokens // 1000 * 0.0032
+def get_summary_cache_path(model, months, text):
+    # The same area text, prompt and model always give the same summary
+    return get_cache_path("summary", model["model_id"], build_system_text(months), text,
+                          suffix=".json.gz")
 
-    print(f'''
-## Token Usage Statistics
-- Input tokens (approx): {input_tokens:,} (${input_price:.2f})
-- Output tokens (approx): {output_tokens:,} (${output_price:.2f})
+
+def cache_summary(model, months, text, summary, stop_reason):
+    # Only cache complete reports; one cut off at maxTokens or missing its
+    # <summary> tags is regenerated on the next run
+    if stop_reason == "end_turn" and SUMMARY_RE.search(summary):
+        write_cache(get_summary_cache_path(model, months, text), json.dumps({"summary": summary}).encode('utf-8'))
+
+
+def get_output_filename(postcode):
+    return f"postcode_summary_{postcode}.md"
+
+
+def write_summary(postcode, summary, usage, model):
+    output_filename = get_output_filename(postcode)
+    if summary is None:
+        print(f"Error: no summary for {postcode}, {output_filename} not written.")
+        return
+
+    # Calculate costs from the token counts Bedrock reported; cached summaries
+    # have no usage as nothing was billed
+    if usage:
+        # Count any prompt cache reads and writes Bedrock reports as input too. No
+        # checkpoint is set so there normally are none, and pricing them at the
+        # full input rate can only over-report
+        input_tokens = (usage.get('inputTokens', 0) + usage.get('cacheReadInputTokens', 0)
+                        + usage.get('cacheWriteInputTokens', 0))
+        output_tokens = usage.get('outputTokens', 0)
+        price_factor = BATCH_PRICE_FACTOR if usage.get('batch') else 1
+        input_price = input_tokens / 1000 * model["input_price"] * price_factor
+        output_price = output_tokens / 1000 * model["output_price"] * price_factor
+
+        print(f'''
+## Token Usage Statistics ({postcode})
+- Input tokens: {input_tokens:,} (${input_price:.2f})
+- Output tokens: {output_tokens:,} (${output_price:.2f})
 - Total inference cost: ${(input_price + output_price):.2f}
 ''')
 
     # Extract content between <summary> tags
-    summary_content = re.search(r'<summary>(.*?)</summary>', summary, re.DOTALL)
+    summary_content = SUMMARY_RE.search(summary)
     if summary_content:
         output_text = summary_content.group(1)
     else:
@@ -357,5 +819,92 @@ def main():
     except Exception as e:
         print(f"Error writing to file: {e}")
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Summarise StreetCheck data for one or more UK postcodes")
+    parser.add_argument("postcodes", nargs="*", help="UK postcodes to report on")
+    parser.add_argument("--file", help="File with one postcode per line")
+    parser.add_argument("--model", choices=MODELS, default=DEFAULT_MODEL,
+                        help=f"Bedrock model to summarise with (default: {DEFAULT_MODEL})")
+    parser.add_argument("--months", type=int, default=CRIME_MONTHS,
+                        help=f"Months of crime data to include, 0 for none (default: {CRIME_MONTHS})")
+    args = parser.parse_args()
+    if args.months < 0:
+        parser.error("--months must not be negative")
+    return args
+
+
+def main():
+    # Set default postcode for Knightsbridge/Kensington area
+    default_postcode = "SW72BU"  # One of London's most expensive areas
+
+    # Get the model, crime months and postcodes from the command line and/or
+    # file, or use the defaults
+    args = parse_args()
+    model = MODELS[args.model]
+    months = args.months
+    postcodes = list(args.postcodes)
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            postcodes += f.read().splitlines()
+    postcodes = [clean_postcode(postcode) for postcode in postcodes]
+    postcodes = list(dict.fromkeys(postcode for postcode in postcodes if postcode))
+    if not postcodes:  # If no postcode is left after cleaning
+        postcodes = [default_postcode]
+
+    # Skip postcodes whose summary file already exists
+    for postcode in list(postcodes):
+        output_filename = get_output_filename(postcode)
+        if os.path.exists(output_filename):
+            print(f"Error: {output_filename} already exists.")
+            postcodes.remove(postcode)
+    if not postcodes:
+        sys.exit(1)
+
+    with ThreadPoolExecutor(max_workers=POSTCODE_CONCURRENCY) as executor:
+        area_texts = executor.map(functools.partial(get_area_text, months=months, session=SESSION), postcodes)
+        texts = dict(zip(postcodes, area_texts))
+
+        # Nothing was fetched for an area with no text (e.g. a mistyped postcode
+        # or a network outage), so there is nothing to summarise or cache
+        for postcode, text in list(texts.items()):
+            if not text:
+                print(f"Error: no StreetCheck data for postcode {postcode}, "
+                      f"{get_output_filename(postcode)} not written.")
+                del texts[postcode]
+
+        # Reuse the summary of any area text that has been summarised before
+        summaries = {}
+        for postcode, text in texts.items():
+            cached = read_cache(get_summary_cache_path(model, months, text), None)
+            if cached is not None:
+                print(f"Loaded cached summary for postcode {postcode}")
+                summaries[postcode] = (json.loads(cached)["summary"], None)
+        pending = {postcode: text for postcode, text in texts.items() if postcode not in summaries}
+
+        # Use one batch job when it's configured and there are enough postcodes
+        # for Bedrock to accept it
+        new_summaries = {}
+        if len(pending) >= BATCH_MIN_RECORDS and BATCH_S3_URI and BATCH_ROLE_ARN:
+            new_summaries = get_batch_summaries(AWS_PROFILE, model, months, pending) or {}
+
+        # Summarise whatever the batch job didn't on demand, several at a time; a
+        # lone summary is echoed as it streams, several would interleave
+        remaining = {postcode: text for postcode, text in pending.items()
+                     if postcode not in new_summaries}
+        if remaining:
+            bedrock_runtime = initialize_bedrock_client(AWS_PROFILE, model["region"])
+            summary_results = executor.map(
+                functools.partial(get_content_summary, bedrock_runtime, model, months,
+                                  echo=len(remaining) == 1),
+                remaining.values())
+            new_summaries.update(zip(remaining, summary_results))
+
+    summaries.update(new_summaries)
+
+    for postcode in texts:
+        write_summary(postcode, *summaries.get(postcode, (None, None)), model)
+
 if __name__ == "__main__":
     main()